@@ -1,16 +1,33 @@
 import os
 import argparse
 from dotenv import load_dotenv
-from src.processor import process_resumes
 from src.database import get_all_candidates
 
 load_dotenv()
 
 
+def format_experience(total_months: int) -> str:
+    years, months = divmod(total_months or 0, 12)
+    return f"{years}y {months}m" if months else f"{years} years"
+
+
+def format_candidate(index: int, candidate: dict) -> str:
+    get = candidate.get
+    return (
+        f"{index}. {get('name')} — {get('general_proficiency')} — "
+        f"{format_experience(get('total_months_experience', 0))}\n"
+        f"   Skills: {get('high_confidence_skills')}\n"
+        f"   Summary: {get('ai_summary')}\n"
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description="Resume Screening Agent")
     parser.add_argument("--resumes_dir", type=str, default="resumes", help="Directory containing resumes")
     parser.add_argument("--server", action="store_true", help="Run as API server")
+    parser.add_argument(
+        "--batch", action="store_true", help="Process resumes via the Message Batches API (cheaper, slower)"
+    )
 
     args = parser.parse_args()
 
@@ -20,25 +37,23 @@ def main():
         uvicorn.run("src.api:app", host="0.0.0.0", port=8000, reload=True)
         return
 
-    # Process resumes
+    # Process resumes (imported here so --server doesn't pay for loading the LLM stack)
+    from src.processor import process_resumes, process_resumes_batch
+
     print(f"Scanning for resumes in {args.resumes_dir}...")
     if not os.path.exists(args.resumes_dir):
         os.makedirs(args.resumes_dir)
         print(f"Created directory {args.resumes_dir}. Please add resumes there.")
 
-    process_resumes(args.resumes_dir)
+    if args.batch:
+        process_resumes_batch(args.resumes_dir)
+    else:
+        process_resumes(args.resumes_dir)
 
     # List all candidates
     candidates = get_all_candidates()
     print(f"\n--- {len(candidates)} Candidates in Database ---")
-    for i, c in enumerate(candidates, 1):
-        total_months = c.get("total_months_experience", 0)
-        years = total_months // 12
-        months = total_months % 12
-        exp = f"{years}y {months}m" if months else f"{years} years"
-        print(f"{i}. {c.get('name')} — {c.get('general_proficiency')} — {exp}")
-        print(f"   Skills: {c.get('high_confidence_skills')}")
-        print(f"   Summary: {c.get('ai_summary')}\n")
+    print("\n".join(format_candidate(i, c) for i, c in enumerate(candidates, 1)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,23 @@
+-- Migration: 002_candidate_content_hash
+-- Description: Store a SHA-256 of each resume file so renamed duplicates are skipped
+-- Created: 2026-10-15
+
+-- ============================================
+-- UP MIGRATION
+-- ============================================
+
+-- up
+ALTER TABLE candidates ADD COLUMN content_hash TEXT;
+
+-- up
+CREATE INDEX IF NOT EXISTS idx_candidates_content_hash ON candidates(content_hash);
+
+-- ============================================
+-- DOWN MIGRATION
+-- ============================================
+
+-- down
+ALTER TABLE candidates DROP COLUMN content_hash;
+
+-- down
+DROP INDEX IF EXISTS idx_candidates_content_hash;
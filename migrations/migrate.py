@@ -20,6 +20,10 @@ from src.database import DB_FILE
 
 MIGRATIONS_DIR = Path(__file__).parent
 
+# Each section runs from its marker to the next "-- up"/"-- down" marker or end of file
+UP_SECTION_RE = re.compile(r'-- up\s*\n(.*?)(?:\n(?=-- (?:up|down))|$)', re.DOTALL)
+DOWN_SECTION_RE = re.compile(r'-- down\s*\n(.*?)(?:\n(?=-- (?:up|down))|$)', re.DOTALL)
+
 
 def get_db_connection():
     """Get database connection."""
@@ -68,16 +72,14 @@ def parse_migration_file(filepath):
     down_statements = []
     
     # Extract up statements
-    # Updated regex to handle files with or without trailing newlines
-    up_matches = re.findall(r'-- up\s*\n(.*?)(?:\n(?=-- (?:up|down))|$)', content, re.DOTALL)
+    up_matches = UP_SECTION_RE.findall(content)
     for match in up_matches:
         statement = match.strip()
         if statement:
             up_statements.append(statement)
     
     # Extract down statements
-    # Updated regex to handle files with or without trailing newlines
-    down_matches = re.findall(r'-- down\s*\n(.*?)(?:\n(?=-- (?:up|down))|$)', content, re.DOTALL)
+    down_matches = DOWN_SECTION_RE.findall(content)
     for match in down_matches:
         statement = match.strip()
         if statement:
@@ -6,6 +6,11 @@ from langchain_core.messages import HumanMessage
 from src.graph import agent_graph
 
 
+def final_text(result) -> str:
+    # .text flattens Anthropic content blocks (text + tool_use) into plain text
+    return result["messages"][-1].text
+
+
 def verify_graph():
     if agent_graph is None:
         print("ERROR: agent_graph is None — check ANTHROPIC_API_KEY")
@@ -13,13 +18,11 @@ def verify_graph():
 
     print("Testing 'process' action...")
     result = agent_graph.invoke({"messages": [HumanMessage(content="process resumes")]})
-    last = result["messages"][-1]
-    print("Result:", last.content if hasattr(last, "content") else last)
+    print("Result:", final_text(result))
 
     print("\nTesting 'query all candidates'...")
     result = agent_graph.invoke({"messages": [HumanMessage(content="show me all candidates")]})
-    last = result["messages"][-1]
-    print("Result:", last.content if hasattr(last, "content") else last)
+    print("Result:", final_text(result))
 
 
 if __name__ == "__main__":
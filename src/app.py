@@ -1,6 +1,9 @@
+import anthropic
 import chainlit as cl
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
 from dotenv import load_dotenv
+import asyncio
 import logging
 import os
 
@@ -15,7 +18,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(getattr(logging, log_level, logging.INFO))
 
-from src.graph import agent_graph
+from src.graph import agent_graph, prefetch_candidates, route_command
+
+# Approximate token budget for prior turns sent with each message; older turns are dropped first
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "4000"))
+
+
+def recent_history(history: list) -> list:
+    """Return the most recent turns of history that fit within HISTORY_TOKEN_BUDGET."""
+    return trim_messages(
+        history,
+        max_tokens=HISTORY_TOKEN_BUDGET,
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        start_on="human",
+    )
 
 
 @cl.on_chat_start
@@ -30,6 +47,28 @@ async def start():
     ).send()
 
 
+async def stream_agent_response(messages: list) -> str:
+    """Stream the agent's answer into a new message and return the final answer text."""
+    # Stream model tokens to the UI as they are generated instead of
+    # waiting for the whole agent run to finish
+    response = cl.Message(content="")
+    step_texts: dict[str, str] = {}
+    async for chunk, metadata in agent_graph.astream({"messages": messages}, stream_mode="messages"):
+        if metadata.get("langgraph_node") != "model" or not isinstance(chunk, AIMessageChunk):
+            continue
+        token = chunk.text
+        if not token:
+            continue
+        if chunk.id not in step_texts and response.content:
+            await response.stream_token("\n\n")
+        step_texts[chunk.id] = step_texts.get(chunk.id, "") + token
+        await response.stream_token(token)
+    await response.send()
+
+    # Earlier model steps only narrate tool calls; the last one is the answer
+    return next(reversed(step_texts.values()), "")
+
+
 @cl.on_message
 async def main(message: cl.Message):
     logger.debug(f"User message: {message.content}")
@@ -38,35 +77,25 @@ async def main(message: cl.Message):
     current_message = HumanMessage(content=message.content.strip())
 
     if agent_graph is None:
-        error = "Agent not available. Please set ANTHROPIC_API_KEY in .env file."
-        await cl.Message(content=error).send()
-        conversation_history.append(current_message)
-        conversation_history.append(AIMessage(content=error))
-        cl.user_session.set("message_history", conversation_history)
-        return
-
-    try:
-        messages_to_send = conversation_history[-20:] + [current_message]
-        result = await agent_graph.ainvoke({"messages": messages_to_send})
-
-        # The last message in result["messages"] is the AI response
-        ai_response = ""
-        if isinstance(result, dict) and "messages" in result:
-            last = result["messages"][-1]
-            ai_response = last.content if hasattr(last, "content") else str(last)
-        else:
-            ai_response = str(result)
-
+        ai_response = "Agent not available. Please set ANTHROPIC_API_KEY in .env file."
         await cl.Message(content=ai_response).send()
+    else:
+        try:
+            routed = await route_command(current_message.content)
+            if routed is not None:
+                ai_response = routed
+                await cl.Message(content=ai_response).send()
+            else:
+                prefetch = asyncio.create_task(prefetch_candidates(current_message.content))
+                ai_response = await stream_agent_response(recent_history(conversation_history) + [current_message])
+                await prefetch
+        except anthropic.APIError as e:
+            # Provider errors (rate limits, overload, timeouts) are recoverable, so report them in
+            # the chat and keep the conversation going; anything else is a bug and propagates.
+            logger.exception("Anthropic API error during agent turn")
+            ai_response = f"Error: {e}"
+            await cl.Message(content=ai_response).send()
 
-        conversation_history.append(current_message)
-        conversation_history.append(AIMessage(content=ai_response))
-
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        error_msg = f"Error: {e}"
-        await cl.Message(content=error_msg).send()
-        conversation_history.append(current_message)
-        conversation_history.append(AIMessage(content=error_msg))
-
+    conversation_history.append(current_message)
+    conversation_history.append(AIMessage(content=ai_response))
     cl.user_session.set("message_history", conversation_history)
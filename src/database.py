@@ -1,9 +1,21 @@
 import sqlite3
-import json
 import os
-from typing import List, Dict, Optional
+import re
+import orjson
+from typing import List, Dict, Optional, Set, Tuple
 
 DB_FILE = "candidates.db"
+# SQLite caps bound parameters per statement (999 on older builds)
+MAX_IN_CLAUSE_PARAMS = 500
+
+SCHEMA_OUT_OF_DATE = (
+    "The candidates database is missing the content_hash column. "
+    "Run `python migrations/migrate.py up` (or `make migrate-up`) to upgrade it."
+)
+
+def _raise_if_schema_out_of_date(error: sqlite3.OperationalError):
+    if 'content_hash' in str(error):
+        raise RuntimeError(SCHEMA_OUT_OF_DATE) from error
 
 def get_db_connection():
     conn = sqlite3.connect(DB_FILE)
@@ -20,8 +32,8 @@ def add_candidate(candidate_data: Dict):
                 filename, name, age, 
                 total_months_experience, total_companies, roles_served,
                 skillset, high_confidence_skills, low_confidence_skills, tech_stack,
-                general_proficiency, ai_summary
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                general_proficiency, ai_summary, content_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             candidate_data.get('filename'),
             candidate_data.get('name'),
@@ -34,7 +46,8 @@ def add_candidate(candidate_data: Dict):
             candidate_data.get('low_confidence_skills', ''),
             candidate_data.get('tech_stack'),
             candidate_data.get('general_proficiency'),
-            candidate_data.get('ai_summary')
+            candidate_data.get('ai_summary'),
+            candidate_data.get('content_hash')
         ))
         
         candidate_id = cursor.lastrowid
@@ -49,6 +62,9 @@ def add_candidate(candidate_data: Dict):
     except sqlite3.IntegrityError:
         conn.rollback()
         return None
+    except sqlite3.OperationalError as e:
+        _raise_if_schema_out_of_date(e)
+        raise
     finally:
         conn.close()
 
@@ -68,7 +84,7 @@ def add_work_experience(cursor, candidate_id: int, work_exp: Dict):
         work_exp.get('months_of_service', 0),
         work_exp.get('skillset', ''),
         work_exp.get('tech_stack', ''),
-        json.dumps(work_exp.get('projects', [])),
+        orjson.dumps(work_exp.get('projects', [])).decode(),
         work_exp.get('is_internship', False),
         work_exp.get('has_overlap', False),
         work_exp.get('start_date', ''),
@@ -86,6 +102,95 @@ def get_candidate_by_filename(filename: str) -> Optional[Dict]:
         return dict(row)
     return None
 
+def _existing_values(column: str, values: List[str]) -> Set[str]:
+    """Return the subset of values already stored in candidates.<column>, using one query per chunk."""
+    if not values:
+        return set()
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    existing = set()
+    try:
+        for start in range(0, len(values), MAX_IN_CLAUSE_PARAMS):
+            batch = values[start:start + MAX_IN_CLAUSE_PARAMS]
+            placeholders = ','.join(['?'] * len(batch))
+            cursor.execute(f'SELECT {column} FROM candidates WHERE {column} IN ({placeholders})', batch)
+            existing.update(row[column] for row in cursor.fetchall())
+    except sqlite3.OperationalError as e:
+        _raise_if_schema_out_of_date(e)
+        raise
+    finally:
+        conn.close()
+    return existing
+
+def get_existing_filenames(filenames: List[str]) -> Set[str]:
+    """Return the subset of filenames that already have a candidate."""
+    return _existing_values('filename', filenames)
+
+def get_existing_content_hashes(content_hashes: List[str]) -> Set[str]:
+    """Return the subset of resume content hashes that already have a candidate."""
+    return _existing_values('content_hash', content_hashes)
+
+# start_date/end_date are stored as written on the resume ("Sep 2019", "2018-05",
+# "Present"), so they can't be ordered as text
+_YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+_MONTH_NAME_RE = re.compile(r'\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\b', re.I)
+_NUMERIC_MONTH_RE = re.compile(r'\b(?:(?:19|20)\d{2}[-/.](\d{1,2})|(\d{1,2})[-/.](?:19|20)\d{2})\b')
+_CURRENT_RE = re.compile(r'\b(?:present|current|now|ongoing|today)\b', re.I)
+_MONTHS = {name: i for i, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+
+def _date_key(text: Optional[str]) -> Tuple[int, int]:
+    """(year, month) parsed from a free-form resume date; (0, 0) if there is no year."""
+    year = _YEAR_RE.search(text or '')
+    if not year:
+        return (0, 0)
+    month_name = _MONTH_NAME_RE.search(text)
+    if month_name:
+        return (int(year.group()), _MONTHS[month_name.group(1).lower()])
+    numeric = _NUMERIC_MONTH_RE.search(text)
+    month = int(numeric.group(1) or numeric.group(2)) if numeric else 0
+    return (int(year.group()), month if 1 <= month <= 12 else 0)
+
+def _recency_key(work_exp: Dict) -> Tuple[bool, Tuple[int, int]]:
+    """Sort key putting current roles first, then the latest start (or end) date."""
+    is_current = bool(_CURRENT_RE.search(work_exp.get('end_date') or ''))
+    started = _date_key(work_exp.get('start_date'))
+    return (is_current, started if started != (0, 0) else _date_key(work_exp.get('end_date')))
+
+def _attach_work_experience(cursor, candidates: List[Dict]):
+    """Load each candidate's work experiences into candidate['work_experience'].
+    
+    Work experiences for all candidates are fetched with one IN (...) query per
+    chunk of MAX_IN_CLAUSE_PARAMS candidates rather than one query each, and each
+    candidate's list is ordered most recent first.
+    """
+    by_candidate = {candidate['id']: [] for candidate in candidates}
+    ids = list(by_candidate)
+    
+    for start in range(0, len(ids), MAX_IN_CLAUSE_PARAMS):
+        batch = ids[start:start + MAX_IN_CLAUSE_PARAMS]
+        placeholders = ','.join(['?'] * len(batch))
+        cursor.execute(f'''
+            SELECT * FROM work_experience 
+            WHERE candidate_id IN ({placeholders})
+            ORDER BY id
+        ''', batch)
+        
+        for row in cursor.fetchall():
+            work_exp = dict(row)
+            # Parse projects JSON
+            if work_exp.get('projects'):
+                try:
+                    work_exp['projects'] = orjson.loads(work_exp['projects'])
+                except:
+                    work_exp['projects'] = []
+            by_candidate[work_exp['candidate_id']].append(work_exp)
+    
+    for candidate in candidates:
+        candidate['work_experience'] = sorted(by_candidate[candidate['id']], key=_recency_key, reverse=True)
+
 def get_candidates_by_ids(candidate_ids: List[int]) -> List[Dict]:
     """Get candidates by their database IDs.
     
@@ -107,26 +212,7 @@ def get_candidates_by_ids(candidate_ids: List[int]) -> List[Dict]:
     cursor.execute(query, candidate_ids)
     candidates = [dict(row) for row in cursor.fetchall()]
     
-    # Get work experiences for each candidate
-    for candidate in candidates:
-        cursor.execute('''
-            SELECT * FROM work_experience 
-            WHERE candidate_id = ?
-            ORDER BY start_date DESC
-        ''', (candidate['id'],))
-        
-        work_exps = []
-        for row in cursor.fetchall():
-            work_exp = dict(row)
-            # Parse projects JSON
-            if work_exp.get('projects'):
-                try:
-                    work_exp['projects'] = json.loads(work_exp['projects'])
-                except:
-                    work_exp['projects'] = []
-            work_exps.append(work_exp)
-        
-        candidate['work_experience'] = work_exps
+    _attach_work_experience(cursor, candidates)
     
     conn.close()
     return candidates
@@ -157,26 +243,29 @@ def get_candidates_by_names(names: List[str]) -> List[Dict]:
     cursor.execute(query, params)
     candidates = [dict(row) for row in cursor.fetchall()]
     
-    # Get work experiences for each candidate
-    for candidate in candidates:
-        cursor.execute('''
-            SELECT * FROM work_experience 
-            WHERE candidate_id = ?
-            ORDER BY start_date DESC
-        ''', (candidate['id'],))
-        
-        work_exps = []
-        for row in cursor.fetchall():
-            work_exp = dict(row)
-            # Parse projects JSON
-            if work_exp.get('projects'):
-                try:
-                    work_exp['projects'] = json.loads(work_exp['projects'])
-                except:
-                    work_exp['projects'] = []
-            work_exps.append(work_exp)
-        
-        candidate['work_experience'] = work_exps
+    _attach_work_experience(cursor, candidates)
+    
+    conn.close()
+    return candidates
+
+def get_candidates_by_proficiency(level: str) -> List[Dict]:
+    """Get candidates whose general proficiency matches a seniority level (case-insensitive partial match).
+    
+    Args:
+        level: Seniority level to match, e.g. "Senior"
+    
+    Returns:
+        List of candidate dictionaries with their work experiences
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        'SELECT * FROM candidates WHERE LOWER(general_proficiency) LIKE LOWER(?)',
+        (f'%{level}%',)
+    )
+    candidates = [dict(row) for row in cursor.fetchall()]
+    _attach_work_experience(cursor, candidates)
     
     conn.close()
     return candidates
@@ -190,30 +279,19 @@ def get_all_candidates() -> List[Dict]:
     cursor.execute('SELECT * FROM candidates')
     candidates = [dict(row) for row in cursor.fetchall()]
     
-    # Get work experiences for each candidate
-    for candidate in candidates:
-        cursor.execute('''
-            SELECT * FROM work_experience 
-            WHERE candidate_id = ?
-            ORDER BY start_date DESC
-        ''', (candidate['id'],))
-        
-        work_exps = []
-        for row in cursor.fetchall():
-            work_exp = dict(row)
-            # Parse projects JSON
-            if work_exp.get('projects'):
-                try:
-                    work_exp['projects'] = json.loads(work_exp['projects'])
-                except:
-                    work_exp['projects'] = []
-            work_exps.append(work_exp)
-        
-        candidate['work_experience'] = work_exps
+    _attach_work_experience(cursor, candidates)
     
     conn.close()
     return candidates
 
+def get_candidates_version() -> Tuple[int, Optional[int]]:
+    """Return a cheap fingerprint of the candidates table that changes when rows are added or removed."""
+    conn = get_db_connection()
+    try:
+        return tuple(conn.execute('SELECT COUNT(*), MAX(id) FROM candidates').fetchone())
+    finally:
+        conn.close()
+
 # Initialize the database when this module is imported (or called explicitly)
 if __name__ == "__main__":
     print("Database initialized.")
@@ -1,14 +1,24 @@
 import os
-import json
+import re
+import time
 import logging
+import threading
 
+import orjson
 from langchain_anthropic import ChatAnthropic
+from langchain_anthropic.middleware import AnthropicPromptCachingMiddleware
 from langchain_core.tools import tool
 from langchain.agents import create_agent
 from dotenv import load_dotenv
 
 from src.processor import process_resumes
-from src.database import get_all_candidates, get_candidates_by_ids, get_candidates_by_names
+from src.database import (
+    get_all_candidates,
+    get_candidates_by_ids,
+    get_candidates_by_names,
+    get_candidates_by_proficiency,
+    get_candidates_version,
+)
 
 load_dotenv()
 
@@ -21,6 +31,61 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(getattr(logging, log_level, logging.INFO))
 
+# Query results are reused across turns for this long. Each entry also records the
+# candidates table version it was read at, so rows written by another process (the API's
+# /process endpoint, `python main.py`) invalidate it on the next lookup.
+QUERY_CACHE_TTL_SECONDS = 300
+QUERY_CACHE_MAX_ENTRIES = 64
+_query_cache: dict[tuple, tuple[float, tuple, str]] = {}
+# Tools run on executor threads (and prefetch runs alongside the agent), so every
+# cache access goes through this lock. The generation is bumped on each clear so a
+# query that started before resumes were processed can't store its stale result.
+_query_cache_lock = threading.Lock()
+_query_cache_generation = 0
+
+
+def _clear_query_cache() -> None:
+    global _query_cache_generation
+    with _query_cache_lock:
+        _query_cache.clear()
+        _query_cache_generation += 1
+
+
+# Common ways users phrase seniority, mapped to the proficiency levels stored by the processor.
+# Searched within the whole phrase ("Sr. developer", "senior-level"); checked in order, so
+# "senior staff engineer" resolves to Lead.
+_SENIORITY_PATTERNS = [
+    (re.compile(r"\b(?:lead|principal|staff)\b", re.I), "Lead"),
+    (re.compile(r"\b(?:sr|snr|senior)\b", re.I), "Senior"),
+    (re.compile(r"\b(?:mid|intermediate)\b", re.I), "Mid"),
+    (re.compile(r"\b(?:jr|junior|entry|graduate|beginner)\b", re.I), "Junior"),
+]
+
+
+def normalize_seniority(seniority: str) -> str | None:
+    """Map free-form seniority wording (e.g. "sr", "entry-level developer") to a stored proficiency level.
+
+    Returns None when no known level is mentioned.
+    """
+    for pattern, level in _SENIORITY_PATTERNS:
+        if pattern.search(seniority):
+            return level
+    return None
+
+
+def _canonical_query(
+    candidate_ids: list[int] | None, names: list[str] | None, seniority: str | None = None
+) -> tuple:
+    """Normalise query arguments so equivalent requests share a cache entry."""
+    if candidate_ids:
+        return ("ids", tuple(sorted(set(candidate_ids))))
+    if names:
+        return ("names", tuple(sorted({name.strip().lower() for name in names})))
+    level = normalize_seniority(seniority) if seniority else None
+    if level:
+        return ("seniority", level)
+    return ("all",)
+
 
 @tool
 def process_resumes_tool(folder_path: str = "resumes") -> str:
@@ -33,46 +98,159 @@ def process_resumes_tool(folder_path: str = "resumes") -> str:
         A message indicating how many resumes were processed.
     """
     logger.debug(f"process_resumes_tool(folder_path='{folder_path}')")
-    if not os.path.exists(folder_path):
-        return f"Directory `{folder_path}` not found."
     try:
         process_resumes(folder_path)
         return f"Processing complete. Checked `{folder_path}` for new resumes."
     except Exception as e:
-        logger.error(f"Error processing resumes: {e}")
+        # A resume vanishing mid-run also raises FileNotFoundError; only the folder itself is "not found"
+        if isinstance(e, FileNotFoundError) and e.filename == folder_path:
+            return f"Directory `{folder_path}` not found."
+        logger.exception(f"Error processing resumes: {e}")
         return f"Error processing resumes: {e}"
+    finally:
+        # New candidates may have been added, even if processing failed partway
+        _clear_query_cache()
+
+
+# Columns that only link or dedupe rows in the DB, and flags that carry no
+# information when false; neither is worth spending prompt tokens on
+_INTERNAL_WORK_FIELDS = {"id", "candidate_id"}
+_INTERNAL_CANDIDATE_FIELDS = {"content_hash"}
+_FLAG_FIELDS = {"is_internship", "has_overlap"}
+# Roles kept per candidate when listing many candidates; ID/name lookups return full history.
+LISTING_MAX_WORK_EXPERIENCE = int(os.environ.get("LISTING_MAX_WORK_EXPERIENCE", "3"))
+
+
+def _is_empty(key: str, value) -> bool:
+    return value is None or value == "" or value == [] or (key in _FLAG_FIELDS and not value)
+
+
+def _compact_candidate(candidate: dict, max_work_experience: int | None = None) -> dict:
+    """Drop empty values and DB-internal keys from a candidate before it is sent to the model.
+
+    If max_work_experience is given, only that many of the most recent roles are kept
+    and the number left out is reported as omitted_work_experience.
+    """
+    compact = {
+        k: v
+        for k, v in candidate.items()
+        if k != "work_experience" and k not in _INTERNAL_CANDIDATE_FIELDS and not _is_empty(k, v)
+    }
+    work_experience = candidate.get("work_experience") or []
+    if max_work_experience is not None and len(work_experience) > max_work_experience:
+        compact["omitted_work_experience"] = len(work_experience) - max_work_experience
+        work_experience = work_experience[:max_work_experience]
+    if work_experience:
+        compact["work_experience"] = [
+            {k: v for k, v in work.items() if k not in _INTERNAL_WORK_FIELDS and not _is_empty(k, v)}
+            for work in work_experience
+        ]
+    return compact
 
 
 @tool
 def query_candidates_tool(
     candidate_ids: list[int] | None = None,
     names: list[str] | None = None,
+    seniority: str | None = None,
 ) -> str:
     """Query the candidate database. Returns candidate profiles as JSON.
 
     - If candidate_ids is provided, fetch those specific candidates (with full work history).
     - If names is provided, search by name (partial, case-insensitive, with full work history).
-    - If neither is provided, return all candidates (with full work history).
+    - If neither is provided, return all candidates, optionally narrowed to one seniority
+      level. Only the most recent roles are included per candidate; fetch by ID for the
+      full history.
 
     Args:
         candidate_ids: Optional list of candidate database IDs to fetch.
         names: Optional list of name strings to search for.
+        seniority: Optional seniority wording as the user gave it (e.g. "sr", "junior", "lead").
+            Normalised automatically; wording with no recognised level is ignored. Only
+            applied when listing candidates.
 
     Returns:
-        JSON string of candidate records.
+        JSON string of candidate records. Empty fields are omitted.
     """
-    logger.debug(f"query_candidates_tool(candidate_ids={candidate_ids}, names={names})")
+    logger.debug(f"query_candidates_tool(candidate_ids={candidate_ids}, names={names}, seniority={seniority})")
+    key = _canonical_query(candidate_ids, names, seniority)
+    with _query_cache_lock:
+        cached = _query_cache.get(key)
+        generation = _query_cache_generation
+    version = get_candidates_version()
+    if cached and time.monotonic() - cached[0] < QUERY_CACHE_TTL_SECONDS and cached[1] == version:
+        logger.debug(f"query_candidates_tool cache hit for {key}")
+        return cached[2]
+
     if candidate_ids:
         candidates = get_candidates_by_ids(candidate_ids)
     elif names:
         candidates = get_candidates_by_names(names)
+    elif key[0] == "seniority":
+        candidates = get_candidates_by_proficiency(key[1])
     else:
         candidates = get_all_candidates()
 
-    if not candidates:
-        return json.dumps({"candidates": [], "message": "No candidates found in the database."})
+    if not candidates and key[0] == "seniority":
+        message = f"No {key[1]} candidates found. Query without seniority to see all candidates."
+        result = orjson.dumps({"candidates": [], "message": message}).decode()
+    elif not candidates:
+        result = orjson.dumps({"candidates": [], "message": "No candidates found in the database."}).decode()
+    else:
+        limit = None if key[0] in ("ids", "names") else LISTING_MAX_WORK_EXPERIENCE
+        compact = [_compact_candidate(c, limit) for c in candidates]
+        result = orjson.dumps({"candidates": compact, "count": len(compact)}, default=str).decode()
+
+    with _query_cache_lock:
+        if generation == _query_cache_generation:
+            if key not in _query_cache and len(_query_cache) >= QUERY_CACHE_MAX_ENTRIES:
+                _query_cache.pop(next(iter(_query_cache)))
+            _query_cache[key] = (time.monotonic(), version, result)
+    return result
+
+
+# Bare "process"-style commands are unambiguous, so they skip the agent's planning call
+_PROCESS_COMMAND_RE = re.compile(
+    r"^\s*(?:please\s+)?(?:process|scan|ingest)(?:\s+(?:new\s+)?resumes?)?"
+    r"(?:\s+from\s+[`'\"]?(?P<folder>[^\s`'\"]+?)[`'\"]?)?\s*[.!]?\s*$",
+    re.I,
+)
+
+
+async def route_command(message: str) -> str | None:
+    """Run deterministic commands directly instead of going through the agent.
+
+    Returns the tool output, or None when the message needs the agent to interpret it.
+    """
+    match = _PROCESS_COMMAND_RE.match(message)
+    if match:
+        logger.debug(f"route_command: '{message}' -> process_resumes_tool")
+        args = {"folder_path": match["folder"]} if match["folder"] else {}
+        return await process_resumes_tool.ainvoke(args)
+    return None
+
+
+# Messages that mention these almost always end with the agent listing candidates
+_CANDIDATE_HINT_RE = re.compile(r"candidate|longlist|shortlist|screen|rank|compare", re.I)
 
-    return json.dumps({"candidates": candidates, "count": len(candidates)}, default=str)
+
+async def prefetch_candidates(message: str) -> None:
+    """Speculatively warm the query cache with the full candidate list.
+
+    Run alongside the agent so the DB read overlaps its planning LLM call; if the agent
+    then lists all candidates, query_candidates_tool is served from the cache.
+    """
+    if not _CANDIDATE_HINT_RE.search(message):
+        return
+    # Only the TTL is checked here; query_candidates_tool notices rows written by other processes
+    with _query_cache_lock:
+        cached = _query_cache.get(("all",))
+    if cached and time.monotonic() - cached[0] < QUERY_CACHE_TTL_SECONDS:
+        return
+    try:
+        await query_candidates_tool.ainvoke({})
+    except Exception as e:
+        logger.debug(f"Candidate prefetch failed: {e}")
 
 
 SYSTEM_PROMPT = """You are an intelligent Resume Screening Assistant. You help users process resumes, search for candidates, and analyse talent pools.
@@ -81,7 +259,7 @@ You have two tools:
 
 1. **process_resumes_tool** — Scans a directory for PDF/DOCX resume files, extracts candidate information using AI, and stores them in the database. Use this when the user wants to process, scan, or import new resumes. Default directory is "resumes".
 
-2. **query_candidates_tool** — Retrieves candidate data from the database as JSON. You can query all candidates, fetch specific IDs, or search by name.
+2. **query_candidates_tool** — Retrieves candidate data from the database as JSON. You can query all candidates, fetch specific IDs, or search by name. Listings include only each candidate's most recent roles; fetch by ID when you need someone's full work history. When listing candidates for a screen with a seniority requirement, pass the user's wording as `seniority` verbatim (e.g. "sr", "mid-level developer") — it is normalised by the tool, so don't rewrite it yourself. If the wording names no recognised level (Junior, Mid, Senior, Lead), the filter is skipped and all candidates are listed.
 
 ## How to handle requests
 
@@ -95,6 +273,8 @@ You have two tools:
 
 **Analysis / comparison:** Call query_candidates_tool to get the relevant data, then provide your own analytical insights.
 
+**Independent steps:** When a request needs several tool calls that don't depend on each other's output (e.g. fetching two different sets of candidates), issue them together in a single turn so they run concurrently. Only sequence calls when one needs the other's result — e.g. processing resumes must finish before querying the new candidates.
+
 **Empty database:** If the query returns no candidates, suggest the user process resumes first or offer to do it automatically.
 
 ## Response formatting
@@ -120,7 +300,16 @@ try:
         temperature=0,
     )
 
-    agent_graph = create_agent(llm, tools, system_prompt=SYSTEM_PROMPT)
+    # The system prompt and tool schemas are identical on every turn, and each
+    # agent step re-sends the conversation so far (including bulky candidate
+    # JSON from tool results). Marking the prefix as cacheable lets later steps
+    # and follow-up turns read it from Anthropic's prompt cache.
+    agent_graph = create_agent(
+        llm,
+        tools,
+        system_prompt=SYSTEM_PROMPT,
+        middleware=[AnthropicPromptCachingMiddleware()],
+    )
 
 except Exception as e:
     print(f"Warning: Could not create agent: {e}")
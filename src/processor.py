@@ -1,13 +1,19 @@
 import os
-import json
-from typing import List, Dict, Optional
+import re
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Iterator, List, Dict, Optional, Tuple
+import anthropic
 import pypdf
 import docx
-from langchain_anthropic import ChatAnthropic
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-from src.database import add_candidate, get_candidate_by_filename
+from langchain_anthropic import ChatAnthropic, convert_to_anthropic_tool
+from langchain_core.messages import SystemMessage
+from langchain_core.exceptions import OutputParserException
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field, ValidationError
+from src.database import add_candidate, get_existing_content_hashes, get_existing_filenames
 
 
 # Define Pydantic model for structured output
@@ -25,6 +31,7 @@ class WorkExperience(BaseModel):
     end_date: str = Field(default="", description="End date (extract if available, 'Present' if current)")
 
 class CandidateProfile(BaseModel):
+    """Structured candidate profile extracted from a resume."""
     name: str = Field(description="Full name of the candidate")
     age: int = Field(description="Age of the candidate, if mentioned. If not, estimate or put 0")
     work_experience: List[WorkExperience] = Field(description="List of all work experiences in chronological order")
@@ -44,38 +51,51 @@ class CandidateProfile(BaseModel):
     ai_summary: str = Field(description="A brief AI-generated summary of the candidate's profile")
 
 def extract_text_from_pdf(filepath: str) -> str:
-    text = ""
+    parts = []
     try:
         with open(filepath, 'rb') as f:
             reader = pypdf.PdfReader(f)
             for page in reader.pages:
-                text += page.extract_text()
+                parts.append(page.extract_text())
     except Exception as e:
         print(f"Error reading PDF {filepath}: {e}")
-    return text
+    return "".join(parts)
 
 def extract_text_from_docx(filepath: str) -> str:
-    text = ""
+    parts = []
     try:
         doc = docx.Document(filepath)
         for para in doc.paragraphs:
-            text += para.text + "\n"
+            parts.append(para.text + "\n")
     except Exception as e:
         print(f"Error reading DOCX {filepath}: {e}")
-    return text
+    return "".join(parts)
 
-def extract_structured_data(text: str) -> Optional[Dict]:
-    try:
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        if not api_key:
-            print("ANTHROPIC_API_KEY not found in environment variables.")
-            return None
+# Text extractor for each supported resume extension (lowercase)
+EXTRACTORS = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+}
+
+def _extension(filename: str) -> str:
+    return os.path.splitext(filename)[1].lower()
 
-        llm = ChatAnthropic(model="claude-sonnet-4-6", anthropic_api_key=api_key, temperature=0)
-        parser = PydanticOutputParser(pydantic_object=CandidateProfile)
-        
-        prompt = PromptTemplate(
-            template="""You are an expert resume parser. Extract detailed structured information from this resume.
+# Extraction is a single-pass structured parse, so a smaller model (e.g. claude-haiku-4-5)
+# is often good enough and cuts cost and latency for large folders
+EXTRACTION_MODEL = os.environ.get("EXTRACTION_MODEL", "claude-sonnet-4-6")
+BATCH_MAX_TOKENS = 8192
+# Resume text beyond this many characters (after whitespace cleanup) is dropped
+MAX_RESUME_CHARS = int(os.environ.get("MAX_RESUME_CHARS", "12000"))
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+# Concurrent extraction requests in process_resumes; keep within your API rate limits
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", "4"))
+# Retries for rate-limited, overloaded or dropped extraction requests. The SDK backs off
+# exponentially with jitter and honours retry-after headers between attempts.
+EXTRACTION_MAX_RETRIES = int(os.environ.get("EXTRACTION_MAX_RETRIES", "5"))
+
+# Static instructions go in the system message so every extraction shares an
+# identical prompt prefix; only the resume text in the human message varies.
+EXTRACTION_INSTRUCTIONS = """You are an expert resume parser. Extract detailed structured information from this resume.
 
 IMPORTANT INSTRUCTIONS FOR WORK EXPERIENCE:
 1. For EACH work experience entry, calculate months_of_service by parsing the duration
@@ -89,58 +109,241 @@ SKILL CLASSIFICATION:
 - high_confidence_skills: Skills with concrete examples in work experience (e.g., "Built REST API using Python")
 - low_confidence_skills: Skills only listed in a skills section without work evidence
 
-AGGREGATED FIELDS TO CALCULATE:
-- total_months_experience: Sum all months_of_service from work experiences
-- total_companies: Count unique company names
-- roles_served: Comma-separated list of unique job titles
-- tech_stack: Aggregate all technologies from work experience entries
+Aggregated fields (totals, roles_served, tech_stack) are derived from the work experience entries as described in the schema.
+"""
 
-Resume text:
-{text}
+# The CandidateProfile schema is sent as a forced tool call, so the model returns
+# validated arguments instead of free text that has to be parsed as JSON.
+_profile_tool = convert_to_anthropic_tool(CandidateProfile)
 
-{format_instructions}
-""",
-            input_variables=["text"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
-        
-        chain = prompt | llm | parser
-        result = chain.invoke({"text": text})
-        return result.dict()
-    
-    except Exception as e:
+# The system block is marked for Anthropic prompt caching: the cached prefix
+# covers the tool schema and the instructions, so after the first resume later
+# extractions read them from cache instead of paying full input price again.
+_system_message = SystemMessage(content=[{
+    "type": "text",
+    "text": EXTRACTION_INSTRUCTIONS,
+    "cache_control": {"type": "ephemeral"},
+}])
+
+EXTRACTION_PROMPT = ChatPromptTemplate.from_messages([
+    _system_message,
+    ("human", "Resume text:\n{text}"),
+])
+
+@lru_cache(maxsize=1)
+def _get_llm(api_key: str) -> ChatAnthropic:
+    # Shared across calls so the underlying SDK client and its keep-alive
+    # connections are reused instead of rebuilt for every resume.
+    return ChatAnthropic(
+        model=EXTRACTION_MODEL,
+        anthropic_api_key=api_key,
+        temperature=0,
+        max_retries=EXTRACTION_MAX_RETRIES,
+    )
+
+@lru_cache(maxsize=1)
+def _get_extraction_chain(api_key: str):
+    # Built once so each extraction is just an invoke, not a re-bind of the schema tool
+    return EXTRACTION_PROMPT | _get_llm(api_key).with_structured_output(CandidateProfile)
+
+def extract_structured_data(text: str) -> Optional[Dict]:
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        print("ANTHROPIC_API_KEY not found in environment variables.")
+        return None
+
+    # Only API and validation failures are expected here; they skip this resume
+    # and processing moves on. Anything else is a bug and should surface.
+    try:
+        result = _get_extraction_chain(api_key).invoke({"text": text})
+    except (anthropic.APIError, ValidationError, OutputParserException) as e:
         print(f"Error extracting structured data: {e}")
         return None
 
+    if result is None:
+        print("Error extracting structured data: model returned no profile")
+        return None
+    return result.model_dump()
+
+def _file_sha256(filepath: str) -> str:
+    with open(filepath, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def _new_resume_files(folder_path: str) -> List[Tuple[str, str]]:
+    """Return (filename, content_hash) for each resume in folder_path not yet in the database.
+
+    A file is skipped if its filename is already stored, or if its content matches a
+    stored resume (or an earlier file in this folder) saved under another name.
+    Raises FileNotFoundError if folder_path does not exist.
+    """
+    # A single scandir both validates the folder and lists it
+    with os.scandir(folder_path) as it:
+        filenames = [
+            entry.name for entry in it
+            if _extension(entry.name) in EXTRACTORS and entry.is_file()
+        ]
+
+    # Check which are already processed in one lookup rather than one per file
+    existing = get_existing_filenames(filenames)
+    unseen = []
+    for filename in filenames:
+        if filename in existing:
+            print(f"Skipping {filename}, already processed.")
+            continue
+        unseen.append((filename, _file_sha256(os.path.join(folder_path, filename))))
+
+    known_hashes = get_existing_content_hashes([content_hash for _, content_hash in unseen])
+    new_files = []
+    for filename, content_hash in unseen:
+        if content_hash in known_hashes:
+            print(f"Skipping {filename}, same content as an already processed resume.")
+            continue
+        known_hashes.add(content_hash)
+        new_files.append((filename, content_hash))
+    return new_files
+
+def compact_resume_text(text: str, filename: str = "resume") -> str:
+    """Collapse layout whitespace and cap the text at MAX_RESUME_CHARS.
+
+    PDF extraction leaves long runs of spaces and blank lines that cost prompt
+    tokens without adding information. Over-long text is cut at the last line
+    break before the limit so a section isn't split mid-line; a notice is printed
+    since the dropped tail usually holds the oldest roles.
+    """
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    text = _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+    if len(text) <= MAX_RESUME_CHARS:
+        return text
+    cut = text.rfind("\n", 0, MAX_RESUME_CHARS)
+    if cut <= 0:
+        cut = MAX_RESUME_CHARS
+    print(f"Truncated {filename} from {len(text)} to {cut} characters (MAX_RESUME_CHARS={MAX_RESUME_CHARS}); "
+          f"older roles may be missing from its profile.")
+    return text[:cut]
+
+def _read_resume(folder_path: str, filename: str) -> str:
+    filepath = os.path.join(folder_path, filename)
+    print(f"Processing {filename}...")
+    
+    # Extract text
+    text = EXTRACTORS[_extension(filename)](filepath)
+    return compact_resume_text(text, filename)
+
+def _pending_resumes(folder_path: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (filename, content_hash, text) for every resume in folder_path not yet in the database.
+
+    Raises FileNotFoundError if folder_path does not exist.
+    """
+    for filename, content_hash in _new_resume_files(folder_path):
+        yield filename, content_hash, _read_resume(folder_path, filename)
+
+def _extract_resume(folder_path: str, filename: str) -> Optional[Dict]:
+    return extract_structured_data(_read_resume(folder_path, filename))
+
 def process_resumes(folder_path: str):
-    if not os.path.exists(folder_path):
-        print(f"Folder {folder_path} not found.")
+    """Extract and store every new resume in folder_path. Raises FileNotFoundError if it doesn't exist.
+
+    Resumes are parsed and extracted on up to EXTRACTION_WORKERS threads, since each
+    one mostly waits on the API. Results are stored from the calling thread so
+    SQLite only ever has one writer.
+    """
+    new_files = _new_resume_files(folder_path)
+    if not new_files:
         return
-    
-    files = os.listdir(folder_path)
-    for filename in files:
-        if filename.endswith('.pdf') or filename.endswith('.docx'):
-            # Check if already processed
-            existing = get_candidate_by_filename(filename)
-            if existing:
-                print(f"Skipping {filename}, already processed.")
-                continue
-            
-            filepath = os.path.join(folder_path, filename)
-            print(f"Processing {filename}...")
-            
-            # Extract text
-            if filename.endswith('.pdf'):
-                text = extract_text_from_pdf(filepath)
-            else:
-                text = extract_text_from_docx(filepath)
-            
-            # Extract structured data
-            data = extract_structured_data(text)
-            
-            if data:
-                data['filename'] = filename
-                add_candidate(data)
-                print(f"Added {data.get('name', 'Unknown')} to database.")
-            else:
-                print(f"Failed to extract structured data for {filename}")
+
+    failure = None
+    handled = set()
+    with ThreadPoolExecutor(max_workers=min(EXTRACTION_WORKERS, len(new_files))) as pool:
+        futures = {pool.submit(_extract_resume, folder_path, filename): (filename, content_hash)
+                   for filename, content_hash in new_files}
+        for future in as_completed(futures):
+            handled.add(future)
+            try:
+                data = future.result()
+            except Exception as e:
+                # Unexpected errors are bugs: stop queued extractions so they aren't
+                # paid for, keep whatever is already in flight, then re-raise
+                failure = e
+                print(f"Error processing {futures[future][0]}: {e}. Cancelling remaining resumes.")
+                pool.shutdown(wait=False, cancel_futures=True)
+                break
+            _store_extracted(data, *futures[future])
+
+    if failure is not None:
+        # Leaving the with block waited for the in-flight extractions to finish
+        for future, (filename, content_hash) in futures.items():
+            if future not in handled and not future.cancelled() and future.exception() is None:
+                _store_extracted(future.result(), filename, content_hash)
+        raise failure
+
+def _store_extracted(data: Optional[Dict], filename: str, content_hash: str):
+    if data:
+        data['filename'] = filename
+        data['content_hash'] = content_hash
+        add_candidate(data)
+        print(f"Added {data.get('name', 'Unknown')} to database.")
+    else:
+        print(f"Failed to extract structured data for {filename}")
+
+def process_resumes_batch(folder_path: str, poll_interval: int = 30):
+    """Process new resumes through the Anthropic Message Batches API.
+
+    Batched requests are billed at half the price of synchronous calls but can
+    take minutes to hours to complete, so this is intended for bulk, offline
+    runs rather than the interactive agent. Raises FileNotFoundError if
+    folder_path doesn't exist.
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        print("ANTHROPIC_API_KEY not found in environment variables.")
+        return
+
+    pending = list(_pending_resumes(folder_path))
+    if not pending:
+        print("No new resumes to process.")
+        return
+
+    # Batch custom_ids only allow [a-zA-Z0-9_-], so key requests by position
+    requests = []
+    for i, (_, _, text) in enumerate(pending):
+        system, human = EXTRACTION_PROMPT.format_messages(text=text)
+        requests.append({
+            "custom_id": f"resume-{i}",
+            "params": {
+                "model": EXTRACTION_MODEL,
+                "max_tokens": BATCH_MAX_TOKENS,
+                "temperature": 0,
+                "system": system.content,
+                "messages": [{"role": "user", "content": human.content}],
+                "tools": [_profile_tool],
+                "tool_choice": {"type": "tool", "name": _profile_tool["name"]},
+            },
+        })
+
+    client = anthropic.Anthropic(api_key=api_key)
+    batch = client.messages.batches.create(requests=requests)
+    print(f"Submitted batch {batch.id} with {len(requests)} resumes. Waiting for results...")
+
+    while batch.processing_status != "ended":
+        time.sleep(poll_interval)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    for entry in client.messages.batches.results(batch.id):
+        filename, content_hash, _ = pending[int(entry.custom_id.rsplit("-", 1)[1])]
+        if entry.result.type != "succeeded":
+            print(f"Failed to extract structured data for {filename} ({entry.result.type})")
+            continue
+
+        tool_input = next(
+            (block.input for block in entry.result.message.content if block.type == "tool_use"), None
+        )
+        try:
+            data = CandidateProfile.model_validate(tool_input).model_dump()
+        except ValidationError as e:
+            print(f"Failed to parse structured data for {filename}: {e}")
+            continue
+
+        data['filename'] = filename
+        data['content_hash'] = content_hash
+        add_candidate(data)
+        print(f"Added {data.get('name', 'Unknown')} to database.")
@@ -0,0 +1,68 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+from src import app
+from src.app import recent_history, stream_agent_response
+
+
+class FakeMessage:
+    def __init__(self, content=""):
+        self.content = content
+        self.tokens = []
+        self.sent = False
+
+    async def stream_token(self, token):
+        self.tokens.append(token)
+        self.content += token
+
+    async def send(self):
+        self.sent = True
+
+
+class FakeGraph:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def astream(self, inputs, stream_mode):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def test_stream_agent_response_separates_steps_and_returns_last(monkeypatch):
+    model = {"langgraph_node": "model"}
+    chunks = [
+        (AIMessageChunk(content="Let me ", id="step-1"), model),
+        (AIMessageChunk(content="check.", id="step-1"), model),
+        (ToolMessage(content='{"count": 2}', tool_call_id="call-1"), {"langgraph_node": "tools"}),
+        (AIMessageChunk(content="", id="step-2"), model),
+        (AIMessageChunk(content="Two ", id="step-2"), model),
+        (AIMessageChunk(content="candidates.", id="step-2"), model),
+    ]
+    messages = []
+
+    def fake_message(content=""):
+        messages.append(FakeMessage(content))
+        return messages[-1]
+
+    monkeypatch.setattr(app.cl, "Message", fake_message)
+    monkeypatch.setattr(app, "agent_graph", FakeGraph(chunks))
+
+    result = asyncio.run(stream_agent_response([HumanMessage(content="How many candidates?")]))
+
+    assert result == "Two candidates."
+    assert messages[0].tokens == ["Let me ", "check.", "\n\n", "Two ", "candidates."]
+    assert messages[0].sent
+
+
+def test_recent_history_drops_oldest_turns_and_starts_on_human(monkeypatch):
+    monkeypatch.setattr(app, "HISTORY_TOKEN_BUDGET", 60)
+    history = []
+    for i in range(5):
+        history += [HumanMessage(content=f"question {i} " * 5), AIMessage(content=f"answer {i} " * 5)]
+
+    trimmed = recent_history(history)
+
+    assert 0 < len(trimmed) < len(history)
+    assert isinstance(trimmed[0], HumanMessage)
+    assert trimmed == history[-len(trimmed):]
@@ -20,7 +20,8 @@ CREATE TABLE candidates (
     low_confidence_skills TEXT,
     tech_stack TEXT,
     general_proficiency TEXT,
-    ai_summary TEXT
+    ai_summary TEXT,
+    content_hash TEXT
 );
 
 CREATE TABLE work_experience (
@@ -106,6 +107,30 @@ def test_get_candidates_by_ids_returns_work_experience(temp_db):
     assert work_experience[0]["role"] == "Engineer"
 
 
+def test_get_existing_filenames(temp_db, monkeypatch):
+    monkeypatch.setattr(database, "MAX_IN_CLAUSE_PARAMS", 2)
+    database.add_candidate(sample_candidate())
+    database.add_candidate(dict(sample_candidate(), filename="other.docx"))
+
+    existing = database.get_existing_filenames(["new.pdf", "resume.pdf", "other.docx"])
+
+    assert existing == {"resume.pdf", "other.docx"}
+
+
+def test_get_existing_content_hashes(temp_db):
+    database.add_candidate(dict(sample_candidate(), content_hash="abc"))
+
+    assert database.get_existing_content_hashes(["abc", "def"]) == {"abc"}
+
+
+def test_get_candidates_version_changes_when_candidates_added(temp_db):
+    assert database.get_candidates_version() == (0, None)
+
+    candidate_id = database.add_candidate(sample_candidate())
+
+    assert database.get_candidates_version() == (1, candidate_id)
+
+
 def test_get_candidates_by_names_partial_match(temp_db):
     candidate_id = database.add_candidate(sample_candidate())
 
@@ -113,3 +138,57 @@ def test_get_candidates_by_names_partial_match(temp_db):
 
     assert len(results) == 1
     assert results[0]["id"] == candidate_id
+
+
+def test_get_candidates_by_proficiency(temp_db):
+    candidate_id = database.add_candidate(sample_candidate())
+    junior = dict(sample_candidate(), filename="junior.pdf", name="John Roe", general_proficiency="Junior")
+    database.add_candidate(junior)
+
+    results = database.get_candidates_by_proficiency("senior")
+
+    assert [c["id"] for c in results] == [candidate_id]
+    assert results[0]["work_experience"][0]["projects"] == ["API"]
+
+
+def test_get_all_candidates_groups_work_experience_across_batches(temp_db, monkeypatch):
+    monkeypatch.setattr(database, "MAX_IN_CLAUSE_PARAMS", 1)
+    first = dict(sample_candidate(), filename="a.pdf")
+    first["work_experience"] = first["work_experience"] + [
+        dict(first["work_experience"][0], role="Lead", start_date="2022", end_date="2024")
+    ]
+    second = dict(sample_candidate(), filename="b.pdf", name="John Roe")
+    first_id = database.add_candidate(first)
+    second_id = database.add_candidate(second)
+
+    results = {c["id"]: c for c in database.get_all_candidates()}
+
+    assert [w["role"] for w in results[first_id]["work_experience"]] == ["Lead", "Engineer"]
+    assert [w["role"] for w in results[second_id]["work_experience"]] == ["Engineer"]
+
+
+def test_work_experience_ordered_by_parsed_dates(temp_db):
+    base = sample_candidate()["work_experience"][0]
+    dated = [("Sep 2019", "Feb 2021"), ("Mar 2021", "Dec 2023"), ("Jan 2024", "Present"), ("2018-05", "2019-08")]
+    candidate = dict(
+        sample_candidate(),
+        work_experience=[dict(base, role=start, start_date=start, end_date=end) for start, end in dated],
+    )
+    candidate_id = database.add_candidate(candidate)
+
+    roles = [w["role"] for w in database.get_candidates_by_ids([candidate_id])[0]["work_experience"]]
+
+    assert roles == ["Jan 2024", "Mar 2021", "Sep 2019", "2018-05"]
+
+
+def test_missing_content_hash_column_asks_for_migration(tmp_path, monkeypatch):
+    db_path = tmp_path / "old.db"
+    monkeypatch.setattr(database, "DB_FILE", str(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.executescript(DDL.replace(",\n    content_hash TEXT", ""))
+    conn.close()
+
+    with pytest.raises(RuntimeError, match="migrate.py up"):
+        database.get_existing_content_hashes(["abc"])
+    with pytest.raises(RuntimeError, match="migrate.py up"):
+        database.add_candidate(sample_candidate())
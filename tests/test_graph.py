@@ -1,7 +1,26 @@
+import asyncio
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from src.graph import process_resumes_tool, query_candidates_tool
+from src import graph
+from src.graph import (
+    normalize_seniority,
+    prefetch_candidates,
+    process_resumes_tool,
+    query_candidates_tool,
+    route_command,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_query_cache(monkeypatch):
+    monkeypatch.setattr("src.graph.get_candidates_version", lambda: (0, None))
+    graph._query_cache.clear()
+    yield
+    graph._query_cache.clear()
 
 
 def test_process_resumes_tool_missing_directory():
@@ -9,6 +28,18 @@ def test_process_resumes_tool_missing_directory():
     assert "not found" in result
 
 
+def test_process_resumes_tool_reports_missing_file_as_error(monkeypatch, tmp_path):
+    def fake_process(path):
+        raise FileNotFoundError(2, "No such file or directory", f"{path}/gone.pdf")
+
+    monkeypatch.setattr("src.graph.process_resumes", fake_process)
+
+    result = process_resumes_tool.invoke({"folder_path": str(tmp_path)})
+
+    assert result.startswith("Error processing resumes")
+    assert "gone.pdf" in result
+
+
 def test_process_resumes_tool_success(monkeypatch, tmp_path):
     resumes_dir = tmp_path / "resumes"
     resumes_dir.mkdir()
@@ -53,3 +84,234 @@ def test_query_candidates_tool_empty(monkeypatch):
     result = json.loads(query_candidates_tool.invoke({}))
     assert result["candidates"] == []
     assert "No candidates" in result["message"]
+
+
+def test_query_candidates_tool_caches_equivalent_queries(monkeypatch):
+    calls = []
+
+    def fake_by_names(names):
+        calls.append(names)
+        return [{"id": 3, "name": "Charlie"}]
+
+    monkeypatch.setattr("src.graph.get_candidates_by_names", fake_by_names)
+
+    first = query_candidates_tool.invoke({"names": ["Charlie", "alice"]})
+    second = query_candidates_tool.invoke({"names": ["  alice", "charlie"]})
+
+    assert first == second
+    assert len(calls) == 1
+
+
+def test_process_resumes_tool_invalidates_query_cache(monkeypatch, tmp_path):
+    resumes_dir = tmp_path / "resumes"
+    resumes_dir.mkdir()
+    results = [[{"id": 1, "name": "Alice"}], [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Bob"}]]
+    monkeypatch.setattr("src.graph.get_all_candidates", lambda: results.pop(0))
+    monkeypatch.setattr("src.graph.process_resumes", lambda path: None)
+
+    assert json.loads(query_candidates_tool.invoke({}))["count"] == 1
+    process_resumes_tool.invoke({"folder_path": str(resumes_dir)})
+    assert json.loads(query_candidates_tool.invoke({}))["count"] == 2
+
+
+def test_query_cache_invalidated_by_writes_from_another_process(monkeypatch):
+    results = [[{"id": 1, "name": "Alice"}], [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Bob"}]]
+    versions = [(1, 1), (1, 1), (2, 2)]
+    monkeypatch.setattr("src.graph.get_all_candidates", lambda: results.pop(0))
+    monkeypatch.setattr("src.graph.get_candidates_version", lambda: versions.pop(0))
+
+    assert json.loads(query_candidates_tool.invoke({}))["count"] == 1
+    assert json.loads(query_candidates_tool.invoke({}))["count"] == 1
+    assert json.loads(query_candidates_tool.invoke({}))["count"] == 2
+
+
+@pytest.mark.parametrize("message", ["process", "Process resumes", "  scan new resumes.", "please ingest resume"])
+def test_route_command_processes_resumes(monkeypatch, message):
+    calls = []
+    monkeypatch.setattr("src.graph.process_resumes", lambda path: calls.append(path))
+
+    result = asyncio.run(route_command(message))
+
+    assert "Processing complete" in result
+    assert calls == ["resumes"]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "process resumes from inbox/2024",
+        "process resumes from inbox/2024.",
+        "process resumes from inbox/2024!",
+        "scan from `inbox/2024`.",
+    ],
+)
+def test_route_command_uses_given_folder(monkeypatch, message):
+    calls = []
+    monkeypatch.setattr("src.graph.process_resumes", lambda path: calls.append(path))
+
+    asyncio.run(route_command(message))
+
+    assert calls == ["inbox/2024"]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "process the resumes and rank Python devs",
+        "process resumes from inbox and rank them",
+        "Process resumes in bulk",
+        "show all candidates",
+        "Who is Alice?",
+    ],
+)
+def test_route_command_defers_to_agent(message):
+    assert asyncio.run(route_command(message)) is None
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("sr", "Senior"),
+        (" Jr. ", "Junior"),
+        ("entry-level", "Junior"),
+        ("staff", "Lead"),
+        ("senior engineer", "Senior"),
+        ("Sr. developer", "Senior"),
+        ("senior-level", "Senior"),
+        ("lead developer", "Lead"),
+        ("mid-level backend engineer", "Mid"),
+        ("director", None),
+        ("experienced", None),
+    ],
+)
+def test_normalize_seniority(raw, expected):
+    assert normalize_seniority(raw) == expected
+
+
+def test_query_candidates_tool_by_seniority(monkeypatch):
+    calls = []
+
+    def fake_by_proficiency(level):
+        calls.append(level)
+        return [{"id": 4, "name": "Dana", "general_proficiency": "Senior"}]
+
+    monkeypatch.setattr("src.graph.get_candidates_by_proficiency", fake_by_proficiency)
+
+    result = json.loads(query_candidates_tool.invoke({"seniority": "sr"}))
+    query_candidates_tool.invoke({"seniority": "Senior"})
+
+    assert result["count"] == 1
+    assert calls == ["Senior"]
+
+
+def test_query_candidates_tool_ignores_unrecognised_seniority(monkeypatch):
+    monkeypatch.setattr("src.graph.get_candidates_by_proficiency", lambda level: pytest.fail("should not filter"))
+    monkeypatch.setattr("src.graph.get_all_candidates", lambda: [{"id": 1, "name": "Alice"}])
+
+    result = json.loads(query_candidates_tool.invoke({"seniority": "director"}))
+
+    assert result["count"] == 1
+
+
+def test_prefetch_candidates_warms_query_cache(monkeypatch):
+    calls = []
+
+    def fake_all():
+        calls.append(True)
+        return [{"id": 1, "name": "Alice"}]
+
+    monkeypatch.setattr("src.graph.get_all_candidates", fake_all)
+
+    asyncio.run(prefetch_candidates("Rank the backend candidates"))
+    result = json.loads(query_candidates_tool.invoke({}))
+
+    assert result["count"] == 1
+    assert len(calls) == 1
+
+
+def test_prefetch_candidates_refreshes_expired_cache(monkeypatch):
+    calls = []
+
+    def fake_all():
+        calls.append(True)
+        return [{"id": 1, "name": "Alice"}]
+
+    monkeypatch.setattr("src.graph.get_all_candidates", fake_all)
+    graph._query_cache[("all",)] = (time.monotonic() - graph.QUERY_CACHE_TTL_SECONDS - 1, (0, None), "stale")
+
+    asyncio.run(prefetch_candidates("Rank the backend candidates"))
+
+    assert len(calls) == 1
+    assert json.loads(graph._query_cache[("all",)][2])["count"] == 1
+
+
+def test_prefetch_candidates_skips_unrelated_messages(monkeypatch):
+    monkeypatch.setattr("src.graph.get_all_candidates", lambda: pytest.fail("should not query"))
+
+    asyncio.run(prefetch_candidates("hello"))
+
+
+def test_query_candidates_tool_drops_empty_and_internal_fields(monkeypatch):
+    fake = [
+        {
+            "id": 5,
+            "name": "Eve",
+            "age": None,
+            "low_confidence_skills": "",
+            "content_hash": "abc123",
+            "total_months_experience": 0,
+            "work_experience": [
+                {"id": 9, "candidate_id": 5, "role": "Engineer", "projects": [], "is_internship": 0, "has_overlap": 0}
+            ],
+        }
+    ]
+    monkeypatch.setattr("src.graph.get_all_candidates", lambda: fake)
+
+    result = json.loads(query_candidates_tool.invoke({}))
+
+    assert result["candidates"] == [
+        {"id": 5, "name": "Eve", "total_months_experience": 0, "work_experience": [{"role": "Engineer"}]}
+    ]
+
+
+def test_listing_keeps_only_recent_work_experience(monkeypatch):
+    candidate = {"id": 1, "name": "Ann", "work_experience": [{"role": f"Role {i}"} for i in range(5)]}
+    monkeypatch.setattr("src.graph.get_all_candidates", lambda: [candidate])
+    monkeypatch.setattr("src.graph.get_candidates_by_ids", lambda ids: [candidate])
+
+    listed = json.loads(query_candidates_tool.invoke({}))["candidates"][0]
+    fetched = json.loads(query_candidates_tool.invoke({"candidate_ids": [1]}))["candidates"][0]
+
+    assert [w["role"] for w in listed["work_experience"]] == ["Role 0", "Role 1", "Role 2"]
+    assert listed["omitted_work_experience"] == 2
+    assert len(fetched["work_experience"]) == 5
+    assert "omitted_work_experience" not in fetched
+
+
+def test_query_started_before_invalidation_is_not_cached(monkeypatch):
+    def fake_all():
+        # Resumes get processed while this query is reading the DB
+        graph._clear_query_cache()
+        return [{"id": 1, "name": "Alice"}]
+
+    monkeypatch.setattr("src.graph.get_all_candidates", fake_all)
+
+    query_candidates_tool.invoke({})
+
+    assert graph._query_cache == {}
+
+
+def test_query_cache_survives_concurrent_eviction_and_clears(monkeypatch):
+    monkeypatch.setattr(graph, "QUERY_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr("src.graph.get_candidates_by_ids", lambda ids: [{"id": ids[0]}])
+
+    def worker(offset):
+        for i in range(200):
+            query_candidates_tool.invoke({"candidate_ids": [offset * 1000 + i]})
+            if i % 50 == 0:
+                graph._clear_query_cache()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(worker, range(8)))
+
+    assert len(graph._query_cache) <= 2
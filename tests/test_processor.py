@@ -1,8 +1,14 @@
+import hashlib
 import os
+import threading
+import time
 import types
 from pathlib import Path
 
+import anthropic
+import httpx
 import pytest
+from langchain_core.runnables import RunnableLambda
 
 from src import processor
 
@@ -43,6 +49,15 @@ def test_extract_text_from_docx(tmp_path):
     assert text == "First line\nSecond line\n"
 
 
+def test_compact_resume_text_collapses_whitespace_and_truncates_at_line(monkeypatch, capsys):
+    assert processor.compact_resume_text("Jane   Doe \n\n\n\n  Experience\t\tACME  \n") == "Jane Doe\n\nExperience ACME"
+    assert capsys.readouterr().out == ""
+
+    monkeypatch.setattr(processor, "MAX_RESUME_CHARS", 15)
+    assert processor.compact_resume_text("Skills: Python\nExperience: ACME", "cv.pdf") == "Skills: Python"
+    assert "Truncated cv.pdf from 31 to 14 characters" in capsys.readouterr().out
+
+
 def test_extract_structured_data_missing_api_key(monkeypatch):
     monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
 
@@ -51,65 +66,89 @@ def test_extract_structured_data_missing_api_key(monkeypatch):
     assert result is None
 
 
+def sample_profile():
+    return {
+        "name": "Parsed",
+        "age": 0,
+        "work_experience": [],
+        "total_months_experience": 0,
+        "total_companies": 0,
+        "roles_served": "",
+        "skillset": "",
+        "high_confidence_skills": "",
+        "low_confidence_skills": "",
+        "tech_stack": "",
+        "general_proficiency": "Junior",
+        "ai_summary": "Summary",
+    }
+
+
 def test_extract_structured_data_with_stubs(monkeypatch):
     monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    prompts = []
 
-    class FakeModel:
-        def __init__(self, data):
-            self._data = data
+    class FakeLLM:
+        def with_structured_output(self, schema):
+            def respond(prompt_value):
+                prompts.append(prompt_value.to_messages())
+                return schema(**sample_profile())
 
-        def dict(self):
-            return self._data
+            return RunnableLambda(respond)
 
-    class FakeParser:
-        def __init__(self, pydantic_object):
-            self._pydantic_object = pydantic_object
+    monkeypatch.setattr(processor, "_get_llm", lambda api_key: FakeLLM())
+    processor._get_extraction_chain.cache_clear()
 
-        def get_format_instructions(self):
-            return "<format>"
+    first = processor.extract_structured_data("Resume text")
+    processor.extract_structured_data("Another resume")
+    processor._get_extraction_chain.cache_clear()
 
-        def parse(self, text):
-            return FakeModel({"ai_summary": text, "name": "Parsed"})
+    assert first == sample_profile()
+    # The instructions are a stable system prefix; only the human message varies
+    assert prompts[0][0].content == prompts[1][0].content
+    assert prompts[0][0].content[0]["cache_control"] == {"type": "ephemeral"}
+    assert prompts[0][1].content == "Resume text:\nResume text"
 
-    class FakeChain:
-        def __init__(self, handler):
-            self._handler = handler
 
-        def __or__(self, other):
-            def handler(params):
-                return other.parse(self._handler(params))
+def test_extract_structured_data_api_error(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
 
-            return FakeChain(handler)
+    def fail(prompt_value):
+        raise anthropic.APIConnectionError(request=httpx.Request("POST", "https://api.anthropic.com"))
 
-        def invoke(self, params):
-            return self._handler(params)
+    monkeypatch.setattr(processor, "_get_extraction_chain", lambda api_key: RunnableLambda(fail))
 
-    class FakePrompt:
-        def __init__(self, template, input_variables, partial_variables):
-            self.template = template
+    assert processor.extract_structured_data("Resume text") is None
 
-        def __or__(self, other):
-            def handler(params):
-                return other.generate(params["text"])
 
-            return FakeChain(handler)
+def test_extract_structured_data_propagates_unexpected_errors(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
 
-    class FakeLLM:
-        def __init__(self, model, anthropic_api_key, temperature):
-            self.model = model
-            self.anthropic_api_key = anthropic_api_key
-            self.temperature = temperature
+    def fail(prompt_value):
+        raise KeyError("bug")
 
-        def generate(self, text):
-            return f"structured: {text}"
+    monkeypatch.setattr(processor, "_get_extraction_chain", lambda api_key: RunnableLambda(fail))
+
+    with pytest.raises(KeyError):
+        processor.extract_structured_data("Resume text")
+
+
+def test_get_llm_reuses_client(monkeypatch):
+    created = []
+
+    class FakeLLM:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
 
-    monkeypatch.setattr(processor, "PydanticOutputParser", FakeParser)
-    monkeypatch.setattr(processor, "PromptTemplate", FakePrompt)
     monkeypatch.setattr(processor, "ChatAnthropic", FakeLLM)
+    processor._get_llm.cache_clear()
 
-    result = processor.extract_structured_data("Resume text")
+    first = processor._get_llm("test-key")
+    second = processor._get_llm("test-key")
 
-    assert result == {"ai_summary": "structured: Resume text", "name": "Parsed"}
+    assert first is second
+    assert len(created) == 1
+    assert created[0]["max_retries"] == processor.EXTRACTION_MAX_RETRIES
+    processor._get_llm.cache_clear()
 
 
 def test_process_resumes_skips_existing(monkeypatch, tmp_path):
@@ -118,12 +157,12 @@ def test_process_resumes_skips_existing(monkeypatch, tmp_path):
     pdf_path = resume_dir / "existing.pdf"
     pdf_path.write_bytes(b"%PDF-1.4")
 
-    monkeypatch.setattr(processor, "get_candidate_by_filename", lambda filename: {"id": 1})
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set(filenames))
 
     def fake_extract(*args, **kwargs):  # pragma: no cover - should not be called
         raise AssertionError("extract_text_from_pdf should not be called for existing candidates")
 
-    monkeypatch.setattr(processor, "extract_text_from_pdf", fake_extract)
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", fake_extract)
 
     processor.process_resumes(str(resume_dir))
 
@@ -136,8 +175,9 @@ def test_process_resumes_adds_new_candidate(monkeypatch, tmp_path):
 
     captured_candidates = []
 
-    monkeypatch.setattr(processor, "get_candidate_by_filename", lambda filename: None)
-    monkeypatch.setattr(processor, "extract_text_from_pdf", lambda filepath: "resume content")
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set())
+    monkeypatch.setattr(processor, "get_existing_content_hashes", lambda hashes: set())
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", lambda filepath: "resume content")
     monkeypatch.setattr(
         processor,
         "extract_structured_data",
@@ -148,5 +188,178 @@ def test_process_resumes_adds_new_candidate(monkeypatch, tmp_path):
     processor.process_resumes(str(resume_dir))
 
     assert captured_candidates == [
-        {"name": "Test User", "work_experience": [], "filename": "new.pdf"}
+        {
+            "name": "Test User",
+            "work_experience": [],
+            "filename": "new.pdf",
+            "content_hash": hashlib.sha256(b"%PDF-1.4").hexdigest(),
+        }
+    ]
+
+
+def test_process_resumes_skips_renamed_duplicates(monkeypatch, tmp_path):
+    resume_dir = tmp_path / "resumes"
+    resume_dir.mkdir()
+    (resume_dir / "copy_of_stored.pdf").write_bytes(b"stored")
+    (resume_dir / "new.pdf").write_bytes(b"new")
+    (resume_dir / "new_again.pdf").write_bytes(b"new")
+
+    stored_hash = hashlib.sha256(b"stored").hexdigest()
+    extracted = []
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set())
+    monkeypatch.setattr(
+        processor, "get_existing_content_hashes", lambda hashes: {h for h in hashes if h == stored_hash}
+    )
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", lambda filepath: os.path.basename(filepath))
+    monkeypatch.setattr(processor, "extract_structured_data", lambda text: extracted.append(text))
+
+    processor.process_resumes(str(resume_dir))
+
+    assert len(extracted) == 1
+    assert extracted[0] in {"new.pdf", "new_again.pdf"}
+
+
+def test_process_resumes_extracts_concurrently_and_stores_on_caller_thread(monkeypatch, tmp_path):
+    resume_dir = tmp_path / "resumes"
+    resume_dir.mkdir()
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        (resume_dir / name).write_bytes(b"%PDF-1.4 " + name.encode())
+
+    # Each extraction waits until all three are in flight, so this only passes if they overlap
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_extract(text):
+        barrier.wait()
+        return {"name": text}
+
+    stored = []
+    monkeypatch.setattr(processor, "EXTRACTION_WORKERS", 3)
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set())
+    monkeypatch.setattr(processor, "get_existing_content_hashes", lambda hashes: set())
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", lambda filepath: os.path.basename(filepath))
+    monkeypatch.setattr(processor, "extract_structured_data", fake_extract)
+    monkeypatch.setattr(processor, "add_candidate", lambda data: stored.append((data, threading.get_ident())))
+
+    processor.process_resumes(str(resume_dir))
+
+    assert sorted(data["filename"] for data, _ in stored) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert all(data["name"] == data["filename"] for data, _ in stored)
+    assert {thread for _, thread in stored} == {threading.get_ident()}
+
+
+def test_process_resumes_cancels_queued_work_after_unexpected_error(monkeypatch, tmp_path):
+    resume_dir = tmp_path / "resumes"
+    resume_dir.mkdir()
+    for i in range(6):
+        (resume_dir / f"{i}.pdf").write_bytes(f"resume {i}".encode())
+
+    calls = []
+
+    def fake_extract(text):
+        calls.append(text)
+        if len(calls) == 1:
+            raise KeyError("boom")
+        time.sleep(0.05)
+        return {"name": text}
+
+    stored = []
+    monkeypatch.setattr(processor, "EXTRACTION_WORKERS", 1)
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set())
+    monkeypatch.setattr(processor, "get_existing_content_hashes", lambda hashes: set())
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", lambda filepath: os.path.basename(filepath))
+    monkeypatch.setattr(processor, "extract_structured_data", fake_extract)
+    monkeypatch.setattr(processor, "add_candidate", lambda data: stored.append(data["filename"]))
+
+    with pytest.raises(KeyError):
+        processor.process_resumes(str(resume_dir))
+
+    # At most the job the worker had already picked up runs after the failure, and it is kept
+    assert len(calls) <= 2
+    assert stored == calls[1:]
+
+
+def test_process_resumes_batch_adds_succeeded_results(monkeypatch, tmp_path):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    resume_dir = tmp_path / "resumes"
+    resume_dir.mkdir()
+    (resume_dir / "good.pdf").write_bytes(b"%PDF-1.4 good")
+    (resume_dir / "bad.pdf").write_bytes(b"%PDF-1.4 bad")
+
+    submitted = {}
+
+    def result(custom_id, succeeded, tool_input=None):
+        block = types.SimpleNamespace(type="tool_use", input=tool_input)
+        message = types.SimpleNamespace(content=[block])
+        outcome = types.SimpleNamespace(type="succeeded" if succeeded else "errored", message=message)
+        return types.SimpleNamespace(custom_id=custom_id, result=outcome)
+
+    class FakeBatches:
+        def create(self, requests):
+            submitted["requests"] = requests
+            return types.SimpleNamespace(id="batch_1", processing_status="in_progress")
+
+        def retrieve(self, batch_id):
+            return types.SimpleNamespace(id=batch_id, processing_status="ended")
+
+        def results(self, batch_id):
+            by_text = {r["params"]["messages"][0]["content"]: r["custom_id"] for r in submitted["requests"]}
+            return [
+                result(by_text["Resume text:\ntext of good.pdf"], True, dict(sample_profile(), name="Good Candidate")),
+                result(by_text["Resume text:\ntext of bad.pdf"], False),
+            ]
+
+    class FakeClient:
+        def __init__(self, api_key):
+            self.messages = types.SimpleNamespace(batches=FakeBatches())
+
+    captured_candidates = []
+
+    monkeypatch.setattr(processor.anthropic, "Anthropic", FakeClient)
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set())
+    monkeypatch.setattr(processor, "get_existing_content_hashes", lambda hashes: set())
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", lambda filepath: f"text of {os.path.basename(filepath)}")
+    monkeypatch.setattr(processor, "add_candidate", lambda data: captured_candidates.append(data))
+
+    processor.process_resumes_batch(str(resume_dir), poll_interval=0)
+
+    assert len(submitted["requests"]) == 2
+    assert submitted["requests"][0]["params"]["tool_choice"] == {"type": "tool", "name": "CandidateProfile"}
+    assert captured_candidates == [
+        dict(
+            sample_profile(),
+            name="Good Candidate",
+            filename="good.pdf",
+            content_hash=hashlib.sha256(b"%PDF-1.4 good").hexdigest(),
+        )
+    ]
+
+
+def test_process_resumes_dispatches_on_extension(monkeypatch, tmp_path):
+    resume_dir = tmp_path / "resumes"
+    resume_dir.mkdir()
+    (resume_dir / "upper.PDF").write_bytes(b"pdf")
+    (resume_dir / "cv.docx").write_bytes(b"docx")
+    (resume_dir / "notes.txt").write_bytes(b"txt")
+    (resume_dir / "folder.pdf").mkdir()
+    (tmp_path / "elsewhere.pdf").write_bytes(b"linked")
+    (resume_dir / "linked.pdf").symlink_to(tmp_path / "elsewhere.pdf")
+
+    read = []
+    monkeypatch.setattr(processor, "get_existing_filenames", lambda filenames: set())
+    monkeypatch.setattr(processor, "get_existing_content_hashes", lambda hashes: set())
+    monkeypatch.setitem(processor.EXTRACTORS, ".pdf", lambda filepath: read.append(("pdf", filepath)) or "")
+    monkeypatch.setitem(processor.EXTRACTORS, ".docx", lambda filepath: read.append(("docx", filepath)) or "")
+    monkeypatch.setattr(processor, "extract_structured_data", lambda text: None)
+
+    processor.process_resumes(str(resume_dir))
+
+    assert sorted(read) == [
+        ("docx", str(resume_dir / "cv.docx")),
+        ("pdf", str(resume_dir / "linked.pdf")),
+        ("pdf", str(resume_dir / "upper.PDF")),
     ]
+
+
+def test_process_resumes_missing_folder(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        processor.process_resumes(str(tmp_path / "missing"))